@@ -1,5 +1,9 @@
 import argparse  # mandatory
+import copy
+import os
 import random
+import threading
+import Queue
 from collections import deque
 
 
@@ -244,20 +248,29 @@ class Board(object):
         """
         try:
             f = open(filename, 'w')
-
-            output = ''
-            output += (str(self.rows) + '\n')
-            output += (str(self.columns) + '\n')
-            for i in range(self.rows):
-                for j in range(self.columns):
-                    output += (self.board[i][j] + ' ')
-                output += '\n'
-
-            f.write(output)
+            f.write(self.format_board())
             f.close()
         except:
             raise IOError
 
+    def format_board(self):
+        """Returns the Board as text in the save_board() file format.
+
+        Returns:
+            A string with the dimensions and rows of the Board (doesn't alters
+            self).
+
+        """
+        output = ''
+        output += (str(self.rows) + '\n')
+        output += (str(self.columns) + '\n')
+        for i in range(self.rows):
+            for j in range(self.columns):
+                output += (self.board[i][j] + ' ')
+            output += '\n'
+
+        return output
+
     def get_value(self, row, column):
         """Returns the value of the cell at the given indices.
 
@@ -436,13 +449,15 @@ class Board(object):
 class Game(object):
     """Handles a game of minesweeper by supplying UI to Board object."""
 
-    def __init__(self, board):
+    def __init__(self, board, checkpointer=None):
         """Initializes a Game object with the given Board object.
 
         The Board object can be a board in any given status or stage.
 
         Args:
             board: a Board object to continue (or start) playing.
+            checkpointer: an optional Checkpointer which is notified of every
+            legal move, so the session is autosaved in the background.
 
         Returns:
             None (alters self)
@@ -452,6 +467,7 @@ class Game(object):
 
         """
         self.board = board
+        self.checkpointer = checkpointer
 
     def get_status(self):
         """Returns the current status of the game.
@@ -511,12 +527,13 @@ class Game(object):
         self.board.uncover(row, column)
         
         cell_value = self.board.get_value(row, column)
-        if cell_value != '0':
-            return cell_value
+        if cell_value == '0':
+            ripple_seq = self.board.ripple_sequence(row, column)
+            for (x,y) in ripple_seq:
+                self.board.uncover(x,y)
 
-        ripple_seq = self.board.ripple_sequence(row, column)
-        for (x,y) in ripple_seq:
-            self.board.uncover(x,y)
+        if self.checkpointer:
+            self.checkpointer.record_move(self.board, row, column)
 
         return cell_value
 
@@ -555,6 +572,9 @@ class Game(object):
 
             print 'Game status: %s'%(status_string)
 
+            if self.checkpointer and self.checkpointer.failed:
+                print 'Autosave failed'
+
             # print available actions
             if status == GameStatus.NotStarted or status == GameStatus.InProgress:
                 print 'Available actions: (1) Save | (2) Exit | (3) Move'
@@ -562,20 +582,22 @@ class Game(object):
                 print 'Available actions: (1) Save | (2) Exit'
 
             # user input
-            ch = raw_input('Enter selection: ')
+            ch = self.read_input('Enter selection: ')
             if ch == '1':
-                filename = raw_input('Enter filename: ')
+                filename = self.read_input('Enter filename: ')
                 try:
                     self.board.save_board(filename)
                 except:
                     print 'Save operation failed'
                 print 'Save operation done'
             elif ch == '2':
+                if self.checkpointer:
+                    self.checkpointer.close(self.board, status == GameStatus.Win or status == GameStatus.Lose)
                 print 'Goodbye :)'
                 return
             elif ch == '3':
                 if status == GameStatus.NotStarted or status == GameStatus.InProgress:
-                    move = raw_input('Enter row then column (space separated): ')
+                    move = self.read_input('Enter row then column (space separated): ')
                     try:
                         r, c = move.split(' ')
                         self.make_move(int(r), int(c))
@@ -586,6 +608,311 @@ class Game(object):
             else:
                 print 'Illegal choice'
 
+    def read_input(self, prompt):
+        """Reads a line of user input, writing the autosave if input ends.
+
+        The autosave is written in the background, so on end of input or an
+        interrupt the checkpointer is closed first, to write the moves which
+        are still pending, and then the exception is raised again.
+
+        Args:
+            prompt: the prompt (as string) to print
+
+        Returns:
+            the line read, without the trailing newline.
+
+        Raises:
+            EOFError, KeyboardInterrupt (generated by raw_input)
+
+        """
+        try:
+            return raw_input(prompt)
+        except (EOFError, KeyboardInterrupt):
+            if self.checkpointer:
+                self.checkpointer.close(self.board)
+            raise
+
+
+class Checkpointer(object):
+    """Autosaves a running Game session in the background.
+
+    A session is kept in two files: a full snapshot of the board (in the
+    save_board() format) and a log of the moves made since that snapshot, one
+    "row column" pair per line. Every move is appended to the log, and every
+    snapshot_moves moves the log is compacted into a new snapshot.
+    All file writes are done by a background thread, which batches whatever
+    is pending and fsyncs it once, so the game loop never waits on the disk.
+    """
+
+    def __init__(self, name, snapshot_moves=10):
+        """Initializes a Checkpointer for the given session name.
+
+        Args:
+            name: the session name (as string), used as the base path for the
+            snapshot (name + '.snap') and the move log (name + '.log').
+            snapshot_moves: the number of moves between two snapshots.
+
+        Returns:
+            None (alters self)
+
+        Raises:
+            Nothing
+
+        """
+        self.snapshot_filename = name + '.snap'
+        self.temp_filename = self.snapshot_filename + '.tmp'
+        self.log_filename = name + '.log'
+        self.snapshot_moves = snapshot_moves
+        self.moves_since_snapshot = 0
+        self.failed = False
+
+        self.queue = Queue.Queue()
+        self.worker = None
+
+    def restore(self):
+        """Restores the latest autosaved state of the session.
+
+        The snapshot is loaded and the moves in the log are replayed on it.
+        Moves which are already part of the snapshot (in case the log wasn't
+        truncated after the last snapshot) are illegal on it and are skipped.
+        A last line without a newline is a torn write, and is ignored.
+        If there's no snapshot but there is a temporary one (a crash while
+        replacing the snapshot), the temporary one is loaded instead.
+
+        Returns:
+            A Board object with the latest state, or None if the session has
+            no snapshot.
+
+        Raises:
+            BoardFormatException, DimensionsMismatchException,
+            SizeOutOfBoundException and ValueError if the autosave files are
+            badly formatted (IOError is raised only if reading fails).
+
+        """
+        if os.path.exists(self.snapshot_filename):
+            f = open(self.snapshot_filename, 'r')
+            try:
+                board = read_board(f)
+            finally:
+                f.close()
+        elif os.path.exists(self.temp_filename):
+            # a crash between removing the old snapshot and renaming the new
+            # one into place (Windows), or while writing the first snapshot
+            f = open(self.temp_filename, 'r')
+            try:
+                board = read_board(f)
+            except:
+                # torn first snapshot, nothing was saved yet
+                return None
+            finally:
+                f.close()
+        else:
+            return None
+
+        if not os.path.exists(self.log_filename):
+            return board
+
+        game = Game(board)
+        f = open(self.log_filename, 'r')
+        try:
+            for line in f:
+                # every record ends with a newline, so a line without one
+                # is the torn tail of a crashed write
+                if not line.endswith('\n'):
+                    break
+                l = line.strip()
+                if len(l) == 0:
+                    continue
+                r, c = l.split(' ')
+                try:
+                    game.make_move(int(r), int(c))
+                except IllegalMoveException:
+                    continue
+        finally:
+            f.close()
+
+        return board
+
+    def start(self, board):
+        """Starts the background writer, beginning with a snapshot of board.
+
+        Returns:
+            None (alters self)
+
+        Raises:
+            Nothing
+
+        """
+        self.worker = threading.Thread(target=self.write_loop)
+        self.worker.daemon = True
+        self.worker.start()
+        self.snapshot(board)
+
+    def record_move(self, board, row, column):
+        """Records a legal move which was just made on board.
+
+        If a previous write failed, a full snapshot of board is queued too,
+        so the autosave recovers from the gap the failure left in the log.
+
+        Returns:
+            None (alters self)
+
+        Raises:
+            Nothing
+
+        """
+        self.queue.put(('move', (row, column)))
+        self.moves_since_snapshot += 1
+        if self.failed or self.moves_since_snapshot >= self.snapshot_moves:
+            self.snapshot(board)
+
+    def snapshot(self, board):
+        """Queues a full snapshot of board, compacting the move log.
+
+        The board is copied here, so the background thread never reads a
+        board which the game loop is altering.
+
+        Returns:
+            None (alters self)
+
+        Raises:
+            Nothing
+
+        """
+        self.queue.put(('snapshot', copy.deepcopy(board)))
+        self.moves_since_snapshot = 0
+
+    def close(self, board, game_over=False):
+        """Writes a final snapshot of board and stops the background writer.
+
+        Args:
+            board: the current Board of the session.
+            game_over: if True, the session is finished and its autosave files
+            are removed, so the next run starts a new game.
+
+        Returns:
+            None (alters self)
+
+        Raises:
+            Nothing
+
+        """
+        if self.worker:
+            if not game_over:
+                self.snapshot(board)
+            self.queue.put(('close', None))
+            self.worker.join()
+            self.worker = None
+
+        if game_over:
+            for filename in [self.log_filename, self.snapshot_filename, self.temp_filename]:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+    def write_loop(self):
+        log = None
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            for kind, item in batch:
+                if kind == 'close':
+                    break
+                try:
+                    if kind == 'snapshot':
+                        log = self.close_log(log)
+                        self.write_snapshot(item)
+                        log = open(self.log_filename, 'w')
+                        self.failed = False
+                    elif not self.failed:
+                        # after a failure the log has a gap, so moves are
+                        # dropped until a new snapshot starts it clean
+                        if log is None:
+                            log = open(self.log_filename, 'a')
+                        log.write('%d %d\n'%(item[0], item[1]))
+                except (IOError, OSError):
+                    self.failed = True
+                    log = self.close_log(log)
+
+            if log is not None:
+                try:
+                    log.flush()
+                    os.fsync(log.fileno())
+                except (IOError, OSError):
+                    self.failed = True
+                    log = self.close_log(log)
+
+            if ('close', None) in batch:
+                self.close_log(log)
+                return
+
+    def close_log(self, log):
+        if log is not None:
+            try:
+                log.close()
+            except (IOError, OSError):
+                pass
+        return None
+
+    def write_snapshot(self, board):
+        f = open(self.temp_filename, 'w')
+        try:
+            f.write(board.format_board())
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+        # os.rename() doesn't overwrite an existing file on Windows
+        if os.name == 'nt' and os.path.exists(self.snapshot_filename):
+            os.remove(self.snapshot_filename)
+        os.rename(self.temp_filename, self.snapshot_filename)
+
+        # the rename must reach the disk before the log is truncated
+        if os.name != 'nt':
+            directory = os.open(os.path.dirname(os.path.abspath(self.snapshot_filename)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+
+def read_board(f):
+    """Reads a Board from a file in the save_board() format.
+
+    Args:
+        f: an open file (or any iterator of lines) positioned at its start.
+
+    Returns:
+        A Board object loaded from the file.
+
+    Raises:
+        Any exception raised while parsing the dimensions, creating the Board
+        or loading it.
+
+    """
+    rows = None
+    columns = None
+    for line in f:
+        l = line.strip()
+        if len(l) == 0:
+            continue
+        if not rows:
+            rows = int(l)
+            continue
+        if not columns:
+            columns = int(l)
+            break
+    board = Board(rows, columns)
+    board.load_board(list(f))
+    return board
+
 def main():
     """Starts the game by parsing the arguments and initializing.
 
@@ -609,6 +936,13 @@ def main():
     non-integer value, argparse should show it's error message without any
     additions. The same goes for illegal options in the command line.
 
+    If an autosave session name was given, the game is autosaved in the
+    background (see Checkpointer), and if the session already has a snapshot,
+    its latest state is restored instead of loading an input file or creating
+    a new board. If the snapshot interval isn't positive print
+    "Illegal autosave values", and if the autosave files can't be restored
+    print "Badly-formatted autosave file", and return.
+
     Returns:
         None
 
@@ -621,30 +955,32 @@ def main():
     parser.add_argument('-r', '--rows', help='number of rows', type=int, default=1)
     parser.add_argument('-c', '--columns', help='number of columns', type=int, default=2)
     parser.add_argument('-m', '--mines', help='number of mines', type=int, default=1)
+    parser.add_argument('-a', '--autosave', help='name of autosave session')
+    parser.add_argument('-s', '--snapshot-moves', help='number of moves between autosave snapshots', type=int, default=10)
     args = parser.parse_args()
 
-    # load input file
+    # restore autosaved session
     board = None
-    if args.input:
+    checkpointer = None
+    if args.autosave:
+        if args.snapshot_moves < 1:
+            print 'Illegal autosave values'
+            return
+        checkpointer = Checkpointer(args.autosave, args.snapshot_moves)
         try:
-            rows = None
-            columns = None
-            for line in args.input:
-                l = line.strip()
-                if len(l) == 0:
-                    continue
-                if not rows:
-                    rows = int(l)
-                    continue
-                if not columns:
-                    columns = int(l)
-                    break
-            board = Board(rows, columns)
-            board.load_board(list(args.input))
+            board = checkpointer.restore()
+        except:
+            print 'Badly-formatted autosave file'
+            return
+
+    # load input file
+    if not board and args.input:
+        try:
+            board = read_board(args.input)
         except:
             print 'Badly-formatted input file'
             return
-    else:
+    elif not board:
         try:
             board = Board(args.rows, args.columns)
             board.put_mines(args.mines)
@@ -652,7 +988,10 @@ def main():
             print 'Illegal rows/columns/mines values'
             return
 
-    game = Game(board)
+    if checkpointer:
+        checkpointer.start(board)
+
+    game = Game(board, checkpointer)
     game.run()
 
 if __name__ == '__main__':